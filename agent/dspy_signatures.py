@@ -1,5 +1,6 @@
+import re
 import dspy
-from typing import Literal
+from typing import Literal, List
 
 # --- Signatures ---
 
@@ -13,6 +14,17 @@ class Router(dspy.Signature):
     question = dspy.InputField(desc="The user's question about retail analytics.")
     strategy = dspy.OutputField(desc="The best strategy: 'sql', 'rag', or 'hybrid'.")
 
+class BatchRouter(dspy.Signature):
+    """
+    Classify each numbered user question to decide the best strategy:
+    - 'sql': for questions requiring aggregation, counting, or specific data from the database (e.g., revenue, quantities, top customers).
+    - 'rag': for questions about policies, marketing calendars, or static definitions (e.g., return policy, dates).
+    - 'hybrid': for questions needing both (e.g., revenue during a specific named campaign).
+    Answer with one line per question using the same index, e.g. "S1: sql".
+    """
+    questions = dspy.InputField(desc="Numbered user questions, one per line (Q1: ..., Q2: ...).")
+    strategies = dspy.OutputField(desc="One line per question: 'S<index>: sql|rag|hybrid'.")
+
 class GenerateSQL(dspy.Signature):
     """
     You are generating SQL for a SQLite database. Follow these STRICT REQUIREMENTS:
@@ -67,13 +79,34 @@ class SynthesizeAnswer(dspy.Signature):
 
 # --- Modules ---
 
+# Keep the whole line after the label; answers like "S1: Strategy: sql" or "S2: SQL + RAG (hybrid)" are common
+_BATCH_STRATEGY_RE = re.compile(r"\bS(\d+)\s*[:.)-]\s*([^\n]*)", re.IGNORECASE)
+
 class CoT_Router(dspy.Module):
     def __init__(self):
         super().__init__()
         self.prog = dspy.ChainOfThought(Router)
+        self.batch_prog = dspy.Predict(BatchRouter)
     
     def forward(self, question):
         return self.prog(question=question)
+    
+    def batch(self, questions: List[str]) -> List[str]:
+        """
+        Classify several questions with a single LLM call.
+        Returns the raw strategy per question, "" where the completion had no answer for it.
+        """
+        if not questions:
+            return []
+        prompt = "\n".join(f"Q{i}: {q}" for i, q in enumerate(questions, start=1))
+        pred = self.batch_prog(questions=prompt)
+        
+        strategies = [""] * len(questions)
+        for index, strategy in _BATCH_STRATEGY_RE.findall(pred.strategies or ""):
+            i = int(index) - 1
+            if 0 <= i < len(questions):
+                strategies[i] = strategy
+        return strategies
 
 class CoT_SQL(dspy.Module):
     def __init__(self):
@@ -84,12 +117,17 @@ class CoT_SQL(dspy.Module):
         return self.prog(question=question, database_schema=schema)
 
 class CoT_Synthesizer(dspy.Module):
+    # Single-literal answers gain nothing from reasoning, so they skip CoT to save output tokens
+    DIRECT_FORMATS = {"int", "float", "bool"}
+    
     def __init__(self):
         super().__init__()
         self.prog = dspy.ChainOfThought(SynthesizeAnswer)
+        self.direct = dspy.Predict(SynthesizeAnswer)
     
     def forward(self, question, context, sql_query, sql_result, format_hint):
-        return self.prog(
+        prog = self.direct if format_hint.strip().lower() in self.DIRECT_FORMATS else self.prog
+        return prog(
             question=question,
             context=context,
             sql_query=sql_query,
@@ -1,10 +1,16 @@
 import os
+import re
 import dspy
+import threading
+from functools import lru_cache, wraps
 from typing import TypedDict, List, Dict, Any, Annotated
 from langgraph.graph import StateGraph, END
 from agent.dspy_signatures import CoT_Router, CoT_SQL, CoT_Synthesizer
 from agent.rag.retrieval import Retriever
+from agent.router_fast import route_question
+from agent.semantic_cache import SemanticSQLCache
 from agent.tools.sqlite_tool import SQLiteTool
+from agent.tools.sql_validator import SQLValidator
 
 # --- State ---
 class AgentState(TypedDict):
@@ -21,20 +27,86 @@ class AgentState(TypedDict):
     errors: List[str]
     repair_count: int
 
+# --- Shared Resources ---
+# Docs, index and DB handles are static for a run, so build them once and share across questions.
+
+# DSPy modules are stateless between calls; sharing them also shares any compiled demos across questions
+_ROUTER = CoT_Router()
+_SQL = CoT_SQL()
+_SYNTH = CoT_Synthesizer()
+
+def get_router() -> CoT_Router:
+    """The shared router, for callers outside the graph such as batch routing."""
+    return _ROUTER
+
+def _build_once(factory):
+    """
+    Cache factory's result like lru_cache(maxsize=1), but also serialize the first call:
+    lru_cache alone lets concurrent workers that miss at the same time each build their own copy.
+    """
+    cached = lru_cache(maxsize=1)(factory)
+    lock = threading.Lock()
+    
+    @wraps(factory)
+    def getter():
+        with lock:
+            return cached()
+    return getter
+
+@_build_once
+def get_retriever() -> Retriever:
+    return Retriever()
+
+@_build_once
+def get_validator() -> SQLValidator:
+    return SQLValidator()
+
+@_build_once
+def get_sqlite_tool() -> SQLiteTool:
+    return SQLiteTool()
+
+@_build_once
+def get_sql_cache() -> SemanticSQLCache:
+    return SemanticSQLCache()
+
+# Tables cited when referenced by the SQL: (name, lowercase, lowercase without spaces)
+_CITED_TABLES = ["Orders", "Order Details", "Products", "Customers"]
+_TABLE_NEEDLES = [(t, t.lower(), t.replace(" ", "").lower()) for t in _CITED_TABLES]
+
+# Deterministic SQL cleaning in one pass: drop markdown fences, YEAR(x) -> strftime('%Y', x), MONTH(x) -> strftime('%m', x)
+_CLEAN_SQL_RE = re.compile(r"```(?:sql)?|\bYEAR\(([^)]+)\)|\bMONTH\(([^)]+)\)", re.IGNORECASE)
+
+def _clean_sql_match(match: re.Match) -> str:
+    if match.group(1) is not None:
+        return f"strftime('%Y', {match.group(1)})"
+    if match.group(2) is not None:
+        return f"strftime('%m', {match.group(2)})"
+    return ""
+
+def clean_sql(sql_query: str) -> str:
+    return _CLEAN_SQL_RE.sub(_clean_sql_match, sql_query).strip()
+
 # --- Nodes ---
 
+def normalize_strategy(strategy: str, default: str = "rag") -> str:
+    """Map a raw router completion onto 'sql', 'rag' or 'hybrid', or default if it names none of them."""
+    strategy = strategy.lower().strip()
+    if "hybrid" in strategy or ("sql" in strategy and "rag" in strategy):
+        return "hybrid"
+    elif "sql" in strategy:
+        return "sql"
+    elif "rag" in strategy:
+        return "rag"
+    return default
+
 def router_node(state: AgentState):
     print(f"--- Router Node ---")
     question = state["question"]
-    router = CoT_Router()
-    pred = router(question=question)
-    strategy = pred.strategy.lower().strip()
-    if "sql" in strategy and "rag" in strategy:
-        strategy = "hybrid"
-    elif "sql" in strategy:
-        strategy = "sql"
-    else:
-        strategy = "rag"
+    strategy = route_question(question)
+    if strategy is None:
+        # No keyword signal, ask the LLM
+        pred = _ROUTER(question=question)
+        strategy = normalize_strategy(pred.strategy)
     
     print(f"Strategy: {strategy}")
     return {"strategy": strategy}
@@ -42,7 +114,7 @@ def router_node(state: AgentState):
 def retriever_node(state: AgentState):
     print(f"--- Retriever Node ---")
     question = state["question"]
-    retriever = Retriever()
+    retriever = get_retriever()
     results = retriever.search(question, top_k=3)
     return {"context": results}
 
@@ -54,23 +126,20 @@ def planner_node(state: AgentState):
 def sql_generator_node(state: AgentState):
     print(f"--- SQL Generator Node ---")
     question = state["question"]
-    db = SQLiteTool()
-    schema = db.get_schema() # Get full schema or filter if needed
+    schema = get_sqlite_tool().get_schema() # Get full schema or filter if needed
     
-    generator = CoT_SQL()
-    pred = generator(question=question, schema=schema)
-    sql_query = pred.sql_query.replace("```sql", "").replace("```", "").strip()
+    # Reuse SQL that already worked for an equivalent question; repairs always regenerate
+    if state.get("repair_count", 0) == 0:
+        cached_sql = get_sql_cache().lookup(question)
+        if cached_sql:
+            print("SQL Cache Hit")
+            return {"sql_query": cached_sql, "schema": schema}
     
-    # Deterministic SQL Cleaning
-    import re
-    # Replace YEAR(x) -> strftime('%Y', x)
-    sql_query = re.sub(r"YEAR\(([^)]+)\)", r"strftime('%Y', \1)", sql_query, flags=re.IGNORECASE)
-    # Replace MONTH(x) -> strftime('%m', x)
-    sql_query = re.sub(r"MONTH\(([^)]+)\)", r"strftime('%m', \1)", sql_query, flags=re.IGNORECASE)
+    pred = _SQL(question=question, schema=schema)
+    sql_query = clean_sql(pred.sql_query)
     
     # Validate SQL against schema
-    from agent.tools.sql_validator import SQLValidator
-    validator = SQLValidator()
+    validator = get_validator()
     validation_result = validator.validate_sql(sql_query)
     
     if not validation_result["valid"]:
@@ -88,13 +157,15 @@ def sql_generator_node(state: AgentState):
 def executor_node(state: AgentState):
     print(f"--- Executor Node ---")
     sql_query = state["sql_query"]
-    db = SQLiteTool()
+    db = get_sqlite_tool()
     result = db.execute_query(sql_query)
     
     if result["error"]:
         print(f"SQL Error: {result['error']}")
         return {"sql_result": result, "errors": [result["error"]]}
     
+    if result["rows"]:
+        get_sql_cache().add(state["question"], sql_query)
     return {"sql_result": result}
 
 def synthesizer_node(state: AgentState):
@@ -108,8 +179,7 @@ def synthesizer_node(state: AgentState):
     # Format context for prompt
     context_str = "\n".join([f"[{c['id']}] {c['content']}" for c in context])
     
-    synthesizer = CoT_Synthesizer()
-    pred = synthesizer(
+    pred = _SYNTH(
         question=question,
         context=context_str,
         sql_query=sql_query,
@@ -121,10 +191,9 @@ def synthesizer_node(state: AgentState):
     citations = []
     if sql_query:
         # Simple heuristic for table citations
-        tables = ["Orders", "Order Details", "Products", "Customers"]
-        for t in tables:
-            if t.lower() in sql_query.lower() or t.replace(" ", "").lower() in sql_query.lower().replace(" ", ""):
-                citations.append(t)
+        sql_lower = sql_query.lower()
+        sql_nospace = sql_lower.replace(" ", "")
+        citations = [t for t, lower, nospace in _TABLE_NEEDLES if lower in sql_lower or nospace in sql_nospace]
     
     for c in context:
         citations.append(c["id"])
@@ -142,8 +211,7 @@ def repair_node(state: AgentState):
     # If validation errors exist, provide schema hints
     errors = state.get("errors", [])
     if errors and any("does not exist" in e or "not found" in e for e in errors):
-        from agent.tools.sql_validator import SQLValidator
-        validator = SQLValidator()
+        validator = get_validator()
         schema_summary = validator.get_schema_summary()
         print(f"Providing schema hints for repair:\n{schema_summary}")
     
@@ -154,6 +222,10 @@ def repair_node(state: AgentState):
 def route_strategy(state: AgentState):
     return state["strategy"]
 
+def route_entry(state: AgentState):
+    # Questions routed up front (batch routing) skip the router node
+    return state.get("strategy") or "router"
+
 def check_execution(state: AgentState):
     errors = state.get("errors", [])
     repair_count = state.get("repair_count", 0)
@@ -175,7 +247,15 @@ def build_graph():
     workflow.add_node("synthesizer", synthesizer_node)
     workflow.add_node("repair", repair_node)
     
-    workflow.set_entry_point("router")
+    workflow.set_conditional_entry_point(
+        route_entry,
+        {
+            "router": "router",
+            "rag": "retriever",
+            "sql": "planner",
+            "hybrid": "retriever"
+        }
+    )
     
     workflow.add_conditional_edges(
         "router",
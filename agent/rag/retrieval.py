@@ -1,18 +1,80 @@
 import os
+import re
 import glob
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
 from typing import List, Dict
+import sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
+_SECTION_RE = re.compile(r'\n## ')
+# Bump when the pickled index layout changes so stale caches are rebuilt
+_INDEX_FORMAT = 2
+
 class Retriever:
     def __init__(self, docs_dir: str = "docs"):
         self.docs_dir = docs_dir
-        self.chunks = []
+        # Chunks are stored column-wise: ids[i], contents[i] and sources[i] describe chunk i
+        self.ids = np.empty(0, dtype=object)
+        self.contents = np.empty(0, dtype=object)
+        self.sources = np.empty(0, dtype=object)
         self.vectorizer = None
         self.tfidf_matrix = None
-        self._load_and_chunk_docs()
-        self._build_index()
+        self.index_path = os.path.join(docs_dir, ".index.pkl")
+        
+        fingerprint = self._docs_fingerprint()
+        if not self._load_cached_index(fingerprint):
+            self._load_and_chunk_docs()
+            self._build_index()
+            self._save_cached_index(fingerprint)
+
+    def _docs_fingerprint(self) -> str:
+        """MD5 over (path, mtime, size) of every doc and the sklearn version, so edits or upgrades invalidate the cached index."""
+        md_files = sorted(glob.glob(os.path.join(self.docs_dir, "*.md")))
+        stats = [(path, os.path.getmtime(path), os.path.getsize(path)) for path in md_files]
+        return hashlib.md5(repr((_INDEX_FORMAT, sklearn.__version__, stats)).encode("utf-8")).hexdigest()
+
+    def _load_cached_index(self, fingerprint: str) -> bool:
+        try:
+            with open(self.index_path, "rb") as f:
+                cached = pickle.load(f)
+        except Exception:
+            return False
+        
+        if cached.get("fingerprint") != fingerprint:
+            return False
+        
+        self.vectorizer = cached["vectorizer"]
+        self.tfidf_matrix = cached["tfidf_matrix"]
+        self.ids = cached["ids"]
+        self.contents = cached["contents"]
+        self.sources = cached["sources"]
+        return True
+
+    def _save_cached_index(self, fingerprint: str):
+        cached = {
+            "fingerprint": fingerprint,
+            "vectorizer": self.vectorizer,
+            "tfidf_matrix": self.tfidf_matrix,
+            "ids": self.ids,
+            "contents": self.contents,
+            "sources": self.sources
+        }
+        tmp_path = None
+        try:
+            # Write to a unique temp file and swap it in, so concurrent builders and readers never see a torn pickle
+            with tempfile.NamedTemporaryFile("wb", dir=self.docs_dir, suffix=".tmp", delete=False) as f:
+                tmp_path = f.name
+                pickle.dump(cached, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            # Caching is best-effort, e.g. docs_dir may be read-only
+            print(f"Could not write retrieval index cache: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     def _load_and_chunk_docs(self):
         """
@@ -20,57 +82,59 @@ class Retriever:
         Simple chunking strategy: Split by '## ' or double newlines.
         """
         md_files = glob.glob(os.path.join(self.docs_dir, "*.md"))
-        chunk_id_counter = 0
+        ids, contents, sources = [], [], []
         
         for file_path in md_files:
             filename = os.path.basename(file_path).replace(".md", "")
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
+            content = Path(file_path).read_text(encoding="utf-8")
             
             # Simple splitting by sections (##)
-            sections = content.split("\n## ")
+            sections = _SECTION_RE.split(content)
             for i, section in enumerate(sections):
                 if i > 0:
                     section = "## " + section # Add back the header marker for non-first chunks
                 
                 # Further split by paragraphs if too long? For now, keep sections.
                 # Clean up empty lines
-                lines = [line.strip() for line in section.split("\n") if line.strip()]
-                if not lines:
+                chunk_text = "\n".join(filter(None, map(str.strip, section.split("\n"))))
+                if not chunk_text:
                     continue
                 
-                chunk_text = "\n".join(lines)
-                chunk_id = f"{filename}::chunk{i}"
-                
-                self.chunks.append({
-                    "id": chunk_id,
-                    "content": chunk_text,
-                    "source": filename
-                })
+                ids.append(f"{filename}::chunk{i}")
+                contents.append(chunk_text)
+                sources.append(filename)
+        
+        self.ids = np.array(ids, dtype=object)
+        self.contents = np.array(contents, dtype=object)
+        self.sources = np.array(sources, dtype=object)
 
     def _build_index(self):
-        if not self.chunks:
+        if not len(self.contents):
             return
         
-        corpus = [chunk["content"] for chunk in self.chunks]
         self.vectorizer = TfidfVectorizer(stop_words='english')
-        self.tfidf_matrix = self.vectorizer.fit_transform(corpus)
+        self.tfidf_matrix = self.vectorizer.fit_transform(self.contents)
 
     def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        if not self.vectorizer or not self.chunks:
+        if not self.vectorizer or not len(self.ids):
             return []
 
         query_vec = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
+        # TF-IDF rows are L2-normalized, so the sparse dot product is the cosine similarity
+        similarities = (self.tfidf_matrix @ query_vec.T).toarray().ravel()
         
-        # Get top k indices
-        top_indices = similarities.argsort()[-top_k:][::-1]
+        # Get top k indices: partial selection in O(N), then sort only the k winners
+        top_k = min(top_k, len(similarities))
+        if top_k <= 0:
+            return []
+        top_indices = np.argpartition(-similarities, top_k - 1)[:top_k]
+        top_indices = top_indices[np.argsort(-similarities[top_indices])]
         
-        results = []
-        for idx in top_indices:
-            if similarities[idx] > 0: # Only return positive matches
-                result = self.chunks[idx].copy()
-                result["score"] = float(similarities[idx])
-                results.append(result)
+        top_indices = top_indices[similarities[top_indices] > 0] # Only return positive matches
         
-        return results
+        return [
+            {"id": chunk_id, "content": content, "source": source, "score": float(score)}
+            for chunk_id, content, source, score in zip(
+                self.ids[top_indices], self.contents[top_indices], self.sources[top_indices], similarities[top_indices]
+            )
+        ]
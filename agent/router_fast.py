@@ -0,0 +1,40 @@
+import re
+from typing import Optional
+
+# --- Keyword Router ---
+# Most questions announce their strategy in surface keywords, so classify those without an LLM call
+# and leave only the ambiguous ones to the CoT Router.
+
+# Aggregation and ranking terms only: entity nouns like "products" or "orders" also appear in doc questions
+SQL_KEYWORDS = [
+    "revenue", "sales", "count", "how many", "number of", "total", "sum", "average", "avg", "aov",
+    "margin", "top", "highest", "lowest", "most", "least", "best", "quantity", "quantities",
+]
+
+RAG_KEYWORDS = [
+    "policy", "policies", "return window", "returns", "calendar", "campaign", "summer beverages",
+    "winter classics", "definition", "define", "kpi", "docs", "according to", "catalog",
+]
+
+def _keyword_pattern(keywords) -> re.Pattern:
+    alternatives = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+
+_SQL_RE = _keyword_pattern(SQL_KEYWORDS)
+_RAG_RE = _keyword_pattern(RAG_KEYWORDS)
+
+def route_question(question: str, min_hits: int = 1) -> Optional[str]:
+    """
+    Classify a question as 'sql', 'rag' or 'hybrid' from keyword hits.
+    Returns None when neither bucket reaches min_hits, so the caller falls back to the LLM Router.
+    """
+    sql_hits = len(_SQL_RE.findall(question))
+    rag_hits = len(_RAG_RE.findall(question))
+
+    if sql_hits >= min_hits and rag_hits >= min_hits:
+        return "hybrid"
+    elif sql_hits >= min_hits:
+        return "sql"
+    elif rag_hits >= min_hits:
+        return "rag"
+    return None
@@ -0,0 +1,133 @@
+import os
+import re
+import json
+import threading
+from typing import List, Optional
+import numpy as np
+
+# Numbers and quoted names must match exactly: "revenue in 1997" and "revenue in 1998" embed almost
+# identically but need different SQL.
+_LITERAL_RE = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+
+class SemanticSQLCache:
+    """
+    Maps previously answered questions to the SQL that executed successfully for them.
+    Lookups embed the question and return the cached SQL of the nearest question above a cosine threshold.
+    Entries persist in cache_dir (emb.npy + sql_cache.json) so repeated eval runs skip SQL generation.
+    Requires sentence-transformers; without it the cache is disabled and lookups always miss.
+    """
+    def __init__(
+        self,
+        cache_dir: str = ".cache",
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        threshold: float = 0.92
+    ):
+        self.emb_path = os.path.join(cache_dir, "emb.npy")
+        self.entries_path = os.path.join(cache_dir, "sql_cache.json")
+        self.model_name = model_name
+        self.threshold = threshold
+        self.enabled = True
+        self._model = None
+        self._lock = threading.Lock()
+        self.entries = []  # [{"question": ..., "sql_query": ...}], row-aligned with embeddings
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.entries_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            embeddings = np.load(self.emb_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        if embeddings.ndim == 2 and len(entries) == len(embeddings):
+            self.entries = entries
+            self.embeddings = embeddings
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.emb_path) or ".", exist_ok=True)
+        # Write to temp files and swap in, so a memory-mapped reader never sees a partial file
+        with open(self.emb_path + ".tmp", "wb") as f:
+            np.save(f, self.embeddings)
+        with open(self.entries_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(self.emb_path + ".tmp", self.emb_path)
+        os.replace(self.entries_path + ".tmp", self.entries_path)
+
+    def _disable(self, reason: str):
+        print(f"Semantic SQL cache disabled: {reason}")
+        self.enabled = False
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        """Embed question, or disable the cache and return None; a cache failure must never fail a question."""
+        try:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            query_vec = self._model.encode([question], normalize_embeddings=True)[0].astype(np.float32)
+        except ImportError:
+            self._disable("sentence-transformers not installed")
+            return None
+        except Exception as e:
+            # e.g. no hub access to download the model on first use, or a corrupt model cache
+            self._disable(str(e))
+            return None
+
+        # Entries persisted by a different model (or a mismatched file) can't be compared; start over
+        if self.entries and self.embeddings.shape[1] != query_vec.shape[0]:
+            print("Semantic SQL cache embeddings do not match the model, discarding cached entries")
+            self.entries = []
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        return query_vec
+
+    @staticmethod
+    def _literals(question: str) -> List[str]:
+        return [m.lower() for m in _LITERAL_RE.findall(question)]
+
+    def lookup(self, question: str) -> Optional[str]:
+        """Return cached SQL for a semantically equivalent question, or None."""
+        with self._lock:
+            if not self.enabled or not self.entries:
+                return None
+            query_vec = self._embed(question)
+            if query_vec is None:
+                return None
+
+            if not self.entries:
+                return None
+
+            try:
+                # Embeddings are L2-normalized, so the dot product is the cosine similarity
+                scores = self.embeddings @ query_vec
+                best = int(np.argmax(scores))
+                entry = self.entries[best]
+                if scores[best] < self.threshold or self._literals(entry["question"]) != self._literals(question):
+                    return None
+                return entry["sql_query"]
+            except Exception as e:
+                # e.g. a malformed cache file
+                self._disable(str(e))
+                return None
+
+    def add(self, question: str, sql_query: str):
+        """Remember SQL that executed successfully for question."""
+        with self._lock:
+            if not self.enabled or not sql_query or any(e["question"] == question for e in self.entries):
+                return
+            query_vec = self._embed(question)
+            if query_vec is None:
+                return
+
+            try:
+                if len(self.entries):
+                    self.embeddings = np.vstack([self.embeddings, query_vec])
+                else:
+                    self.embeddings = query_vec[np.newaxis, :]
+            except Exception as e:
+                self._disable(str(e))
+                return
+            self.entries.append({"question": question, "sql_query": sql_query})
+            try:
+                self._save()
+            except OSError as e:
+                print(f"Could not write semantic SQL cache: {e}")
@@ -1,34 +1,47 @@
 import re
-from typing import List, Set, Dict, Any
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from typing import List, Set, Dict, Any, Optional
 from agent.tools.sqlite_tool import SQLiteTool
 
+# Compiled once at import; used when sqlglot cannot parse a generated query
+# CTE names only appear right after WITH [RECURSIVE] or after the "), " closing the previous CTE,
+# which keeps "FROM t AS a" style aliases from being taken for CTEs
+_CTE_NAME_RE = re.compile(r'(?:\b(WITH)\s+(?:RECURSIVE\s+)?|\)\s*,\s*)(\w+)(?:\s*\([^()]*\))?\s+AS\s*\(', re.IGNORECASE)
+_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+(?:[`"\[]([^`"\]]+)[`"\]]|(\w+))', re.IGNORECASE)
+_CAMEL_CASE_RE = re.compile(r'([a-z])([A-Z])')
+_COLUMN_RE = re.compile(r'\b(\w+)\.(\w+)\b')
+
+def _trigrams(text: str) -> Set[str]:
+    # Boundary markers give short names trigrams and weight matching prefixes/suffixes
+    padded = f"^{text}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
 class SQLValidator:
     def __init__(self, db_path: str = "data/northwind.sqlite"):
         self.db = SQLiteTool(db_path)
         self.valid_tables = set()
         self.valid_columns = {}  # table -> set of columns
         self._load_schema()
+        # Lookup structures derived from the schema, built once instead of per query
+        self._tables_by_nospace = {t.replace(' ', ''): t for t in self.valid_tables}
+        self._all_columns = set().union(*self.valid_columns.values())
+        self._col_trigrams = {col: _trigrams(col) for col in self._all_columns}
     
     def _load_schema(self):
-        """Load all valid tables and columns from the database."""
-        tables = self.db.get_all_tables()
-        for table in tables:
-            self.valid_tables.add(table.lower())
-            # Get columns for this table
-            schema_str = self.db.get_schema([table])
-            columns = self._extract_columns_from_schema(schema_str)
-            self.valid_columns[table.lower()] = set(c.lower() for c in columns)
-    
-    def _extract_columns_from_schema(self, schema_str: str) -> List[str]:
-        """Extract column names from schema string."""
-        columns = []
-        for line in schema_str.split('\n'):
-            if line.strip().startswith('- '):
-                # Format: "  - ColumnName (TYPE)"
-                match = re.match(r'\s*-\s*(\w+)\s*\(', line)
-                if match:
-                    columns.append(match.group(1))
-        return columns
+        """Load all valid tables and columns from the database in a single query."""
+        result = self.db.execute_query(
+            "SELECT m.name, p.name FROM sqlite_master m "
+            "JOIN pragma_table_info(m.name) p WHERE m.type = 'table'"
+        )
+        if result["error"]:
+            raise RuntimeError(f"Could not load schema: {result['error']}")
+        
+        for table, column in result["rows"]:
+            table = table.lower()
+            self.valid_tables.add(table)
+            self.valid_columns.setdefault(table, set()).add(column.lower())
     
     def validate_sql(self, sql_query: str) -> Dict[str, Any]:
         """
@@ -38,102 +51,152 @@ class SQLValidator:
         if not sql_query or sql_query.strip() == "":
             return {"valid": True, "errors": []}
         
+        # Parse once and walk the AST; fall back to the regex heuristics for SQL sqlglot can't tokenize or parse
+        try:
+            tree = sqlglot.parse_one(sql_query, dialect="sqlite")
+        except SqlglotError: # ParseError or TokenError (e.g. an unterminated quote)
+            tree = None
+        
+        if tree is None:
+            errors = self._validate_with_regex(sql_query)
+        else:
+            errors = self._validate_ast(tree)
+        
+        # The same bad reference often appears in SELECT, GROUP BY and ORDER BY; report it once
+        errors = list(dict.fromkeys(errors))
+        return {
+            "valid": len(errors) == 0,
+            "errors": errors
+        }
+    
+    def _validate_ast(self, tree: exp.Expression) -> List[str]:
+        """Check tables and qualified columns of a parsed query, including subqueries and UNIONs."""
         errors = []
         
-        # Extract CTE names (Common Table Expressions) from WITH clauses
-        # Simple approach: find all "name AS (" patterns that appear before the main query
-        cte_names = set()
-        if re.search(r'\bWITH\b', sql_query, re.IGNORECASE):
-            # Find all potential CTE names (word followed by AS ()
-            # This will catch: WITH cte1 AS (...), cte2 AS (...)
-            all_cte_matches = re.findall(r'\b(\w+)\s+AS\s*\(', sql_query, re.IGNORECASE)
-            # Add all found names as potential CTEs
-            cte_names = set(all_cte_matches)
+        # CTEs and derived tables are defined by the query itself, not the schema
+        cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        derived_aliases = {sq.alias.lower() for sq in tree.find_all(exp.Subquery) if sq.alias}
+        
+        # Qualifier (alias or bare name) -> table name as written, e.g. {"od": "OrderDetails", "s": "sales"}
+        aliases = {}
+        for table in tree.find_all(exp.Table):
+            aliases[table.alias_or_name.lower()] = table.name
+            if table.name.lower() in cte_names:
+                continue
+            self._check_table(table.name, errors)
+        
+        for column in tree.find_all(exp.Column):
+            # Unqualified names may be SELECT aliases, and columns of CTEs/subqueries are projections
+            if not column.table or isinstance(column.this, exp.Star):
+                continue
+            qualifier = column.table.lower()
+            if qualifier in derived_aliases:
+                continue
+            table_name = aliases.get(qualifier)
+            if table_name is None:
+                # Unknown qualifier: fall back to checking the column exists in ANY table
+                if qualifier not in cte_names:
+                    self._check_column(column.name, errors)
+                continue
+            if table_name.lower() in cte_names:
+                continue
+            # Missing tables are reported above; only check columns of tables that resolve
+            schema_table = self._resolve_table(table_name)
+            if schema_table is not None:
+                self._check_column(column.name, errors, table=schema_table)
         
+        return errors
+    
+    def _validate_with_regex(self, sql_query: str) -> List[str]:
+        errors = []
         
+        # Extract CTE names (Common Table Expressions) from WITH clauses in a single scan
+        # This will catch: WITH cte1 AS (...), cte2(col) AS (...)
+        cte_matches = _CTE_NAME_RE.findall(sql_query)
+        cte_names = set()
+        if any(with_kw for with_kw, _ in cte_matches):
+            cte_names = {name.lower() for _, name in cte_matches}
         
         # Extract table names from SQL (improved regex to handle quotes and spaces)
         # Look for FROM/JOIN patterns with optional quotes
-        table_pattern = r'\b(?:FROM|JOIN)\s+(?:[`"\[]([^`"\]]+)[`"\]]|(\w+))'
-        matches = re.findall(table_pattern, sql_query, re.IGNORECASE)
+        matches = _TABLE_RE.findall(sql_query)
         
         # Flatten the tuple results (regex returns groups)
         found_tables = [m[0] if m[0] else m[1] for m in matches]
         
         for table in found_tables:
-            # Clean the table name
-            clean_table = table.strip()
-            
             # Skip if this is a CTE
-            if clean_table.lower() in {c.lower() for c in cte_names}:
+            if table.strip().lower() in cte_names:
                 continue
-            
-            # Try multiple matching strategies
-            table_lower = clean_table.lower()
-            
-            # Convert CamelCase to space-separated (e.g., OrderDetails -> order details)
-            spaced_table = re.sub(r'([a-z])([A-Z])', r'\1 \2', clean_table).lower()
-            
-            # Also try matching by removing all spaces (e.g., orderdetails -> order details)
-            # Check if the table (without spaces) matches any valid table (without spaces)
-            table_no_space = table_lower.replace(' ', '')
-            found_match = False
-            
-            for valid_table in self.valid_tables:
-                valid_no_space = valid_table.replace(' ', '')
-                if table_lower == valid_table or spaced_table == valid_table or table_no_space == valid_no_space:
-                    found_match = True
-                    break
-            
-            if not found_match:
-                errors.append(f"Table '{table}' does not exist in schema. Valid tables: {', '.join(sorted(self.valid_tables))}")
+            self._check_table(table, errors)
         
         # Extract column references (simplified - looks for word.word patterns)
         # This is a heuristic and may have false positives/negatives
-        column_pattern = r'\b(\w+)\.(\w+)\b'
-        found_columns = re.findall(column_pattern, sql_query)
+        found_columns = _COLUMN_RE.findall(sql_query)
         
         for table_alias, column in found_columns:
-            # Try to match alias to actual table (this is imperfect)
-            # For now, just check if column exists in ANY table
-            column_lower = column.lower()
-            found_in_any_table = False
-            for table_cols in self.valid_columns.values():
-                if column_lower in table_cols:
-                    found_in_any_table = True
-                    break
-            
-            if not found_in_any_table:
-                # Find similar column names (fuzzy matching)
-                suggestions = self._find_similar_columns(column_lower)
-                if suggestions:
-                    errors.append(f"Column '{column}' not found in any table schema. Did you mean: {', '.join(suggestions)}?")
-                else:
-                    errors.append(f"Column '{column}' not found in any table schema")
+            self._check_column(column, errors)
         
-        return {
-            "valid": len(errors) == 0,
-            "errors": errors
-        }
+        return errors
     
-    def _find_similar_columns(self, column: str, max_suggestions: int = 3) -> List[str]:
-        """Find similar column names using simple string matching."""
-        all_columns = set()
-        for cols in self.valid_columns.values():
-            all_columns.update(cols)
+    def _resolve_table(self, table: str) -> Optional[str]:
+        """Map a table name as written in SQL to its schema table, or None if it does not exist."""
+        # Clean the table name
+        clean_table = table.strip()
         
-        # Simple similarity: check if column is a substring or vice versa
-        suggestions = []
-        for valid_col in all_columns:
-            if column in valid_col or valid_col in column:
-                suggestions.append(valid_col)
+        # Try multiple matching strategies
+        table_lower = clean_table.lower()
         
-        return suggestions[:max_suggestions]
+        # Convert CamelCase to space-separated (e.g., OrderDetails -> order details)
+        spaced_table = _CAMEL_CASE_RE.sub(r'\1 \2', clean_table).lower()
         
-        return {
-            "valid": len(errors) == 0,
-            "errors": errors
-        }
+        # Also try matching by removing all spaces (e.g., orderdetails -> order details)
+        # Check if the table (without spaces) matches any valid table (without spaces)
+        table_no_space = table_lower.replace(' ', '')
+        if table_lower in self.valid_tables:
+            return table_lower
+        if spaced_table in self.valid_tables:
+            return spaced_table
+        return self._tables_by_nospace.get(table_no_space)
+    
+    def _check_table(self, table: str, errors: List[str]):
+        if self._resolve_table(table) is None:
+            errors.append(f"Table '{table}' does not exist in schema. Valid tables: {', '.join(sorted(self.valid_tables))}")
+    
+    def _check_column(self, column: str, errors: List[str], table: Optional[str] = None):
+        """Check column against table's columns when the qualifier was resolved, else against ANY table."""
+        column_lower = column.lower()
+        
+        if table is not None:
+            if column_lower not in self.valid_columns.get(table, set()):
+                suggestions = self._find_similar_columns(column_lower, table=table)
+                hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+                errors.append(f"Column '{column}' not found in table '{table}'.{hint}")
+            return
+        
+        if column_lower not in self._all_columns:
+            # Find similar column names (fuzzy matching)
+            suggestions = self._find_similar_columns(column_lower)
+            if suggestions:
+                errors.append(f"Column '{column}' not found in any table schema. Did you mean: {', '.join(suggestions)}?")
+            else:
+                errors.append(f"Column '{column}' not found in any table schema")
+    
+    def _find_similar_columns(
+        self, column: str, max_suggestions: int = 3, min_similarity: float = 0.15, table: Optional[str] = None
+    ) -> List[str]:
+        """Find similar column names (within table if given), ranked by trigram Jaccard similarity."""
+        query = _trigrams(column)
+        candidates = self.valid_columns.get(table, set()) if table is not None else self._all_columns
+        scored = []
+        for valid_col in candidates:
+            grams = self._col_trigrams[valid_col]
+            score = len(query & grams) / len(query | grams)
+            if score >= min_similarity:
+                scored.append((score, valid_col))
+        
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [valid_col for _, valid_col in scored[:max_suggestions]]
     
     def get_schema_summary(self) -> str:
         """Return a summary of valid tables and columns."""
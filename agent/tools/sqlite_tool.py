@@ -1,25 +1,37 @@
 import sqlite3
 import os
+import threading
 from typing import List, Dict, Any, Optional
 
 class SQLiteTool:
     def __init__(self, db_path: str = "data/northwind.sqlite"):
         self.db_path = db_path
+        self._conn = None
+        self._schema_cache = None
+        # One connection is shared by all worker threads; sqlite3 objects are not safe for concurrent use
+        self._lock = threading.RLock()
 
     def _get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """Lazily open a single read-only tuned connection and reuse it for every call."""
+        if self._conn is None:
+            # Autocommit (no implicit transactions) and a larger prepared-statement cache: repeated
+            # queries across repair loops and similar questions reuse their compiled plan by SQL text
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, cached_statements=256)
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-65536")
+            conn.execute("PRAGMA query_only=ON")
+            self._conn = conn
+        return self._conn
 
     def execute_query(self, query: str) -> Dict[str, Any]:
         """
         Executes a SQL query and returns the results or error.
         """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(query)
-            columns = [description[0] for description in cursor.description] if cursor.description else []
-            rows = cursor.fetchall()
-            conn.close()
+            with self._lock:
+                cursor = self._get_connection().execute(query)
+                columns = [description[0] for description in cursor.description] if cursor.description else []
+                rows = cursor.fetchall()
             return {
                 "columns": columns,
                 "rows": rows,
@@ -36,9 +48,15 @@ class SQLiteTool:
         """
         Returns the schema for the specified tables or all tables if None.
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
+        with self._lock:
+            if table_names:
+                return self._build_schema(self._get_connection().cursor(), table_names)
+            # The full schema is static for a run, so build it once
+            if self._schema_cache is None:
+                self._schema_cache = self._build_schema(self._get_connection().cursor(), None)
+            return self._schema_cache
+
+    def _build_schema(self, cursor: sqlite3.Cursor, table_names: Optional[List[str]]) -> str:
         if table_names:
             tables_query = f"SELECT name FROM sqlite_master WHERE type='table' AND name IN ({','.join(['?']*len(table_names))})"
             cursor.execute(tables_query, table_names)
@@ -57,13 +75,10 @@ class SQLiteTool:
                 schema_str += f"  - {col[1]} ({col[2]})\n"
             schema_str += "\n"
             
-        conn.close()
         return schema_str
 
     def get_all_tables(self) -> List[str]:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return tables
+        with self._lock:
+            cursor = self._get_connection().cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            return [row[0] for row in cursor.fetchall()]
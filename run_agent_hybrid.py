@@ -1,72 +1,127 @@
+import os
+# Keep the DSPy/LiteLLM disk cache next to the project so reruns hit it; must be set before importing dspy
+os.environ.setdefault("DSPY_CACHEDIR", ".dspy_cache")
+
 import dspy
 import json
 import argparse
-import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from typing import List, Dict
-from agent.graph_hybrid import build_graph
+from agent.graph_hybrid import build_graph, get_router, normalize_strategy
+from agent.dspy_signatures import CoT_Router
+from agent.router_fast import route_question
 
-# Configure DSPy with Ollama
-lm = dspy.LM(model='ollama/phi3.5:3.8b-mini-instruct-q4_K_M', max_tokens=1000)
+# Configure DSPy. Defaults to Ollama; set LM_MODEL/LM_API_BASE to point at an OpenAI-compatible
+# server with continuous batching (vLLM, llama.cpp server) so concurrent questions share forward passes.
+lm_kwargs = {"api_base": os.environ.get("LM_API_BASE"), "api_key": os.environ.get("LM_API_KEY")}
+lm = dspy.LM(
+    model=os.environ.get("LM_MODEL", "ollama/phi3.5:3.8b-mini-instruct-q4_K_M"),
+    max_tokens=1000,
+    cache=True,
+    **{k: v for k, v in lm_kwargs.items() if v}
+)
 dspy.configure(lm=lm)
 
-def process_questions(input_file: str, output_file: str):
-    print(f"Loading questions from {input_file}...")
-    with open(input_file, "r") as f:
-        questions = [json.loads(line) for line in f]
+# Number of questions packed into a single routing prompt
+ROUTER_BATCH_SIZE = 8
+
+def route_batch(router: CoT_Router, questions: List[Dict]) -> List[str]:
+    """
+    Route a chunk of questions: keyword routing first, then one LLM call for the rest.
+    "" leaves a question to the graph's router node.
+    """
+    strategies = [route_question(q["question"]) or "" for q in questions]
+    unresolved = [i for i, s in enumerate(strategies) if not s]
+    if not unresolved:
+        return strategies
     
-    app = build_graph()
-    results = []
+    try:
+        raw = router.batch([questions[i]["question"] for i in unresolved])
+    except Exception as e:
+        print(f"Batch routing failed, falling back to per-question routing: {e}")
+        return strategies
+    for i, s in zip(unresolved, raw):
+        # Unrecognised answers stay "" so the graph's router node decides
+        strategies[i] = normalize_strategy(s, default="")
+    return strategies
+
+def process_question(app, q: Dict, strategy: str = "") -> Dict:
+    print(f"\nProcessing: {q['id']}")
+    initial_state = {
+        "question": q["question"],
+        "format_hint": q["format_hint"],
+        "strategy": strategy,
+        "context": [],
+        "schema": "",
+        "sql_query": "",
+        "sql_result": {},
+        "final_answer": None,
+        "explanation": "",
+        "citations": [],
+        "errors": [],
+        "repair_count": 0
+    }
     
-    for q in questions:
-        print(f"\nProcessing: {q['id']}")
-        initial_state = {
-            "question": q["question"],
-            "format_hint": q["format_hint"],
-            "strategy": "",
-            "context": [],
-            "schema": "",
-            "sql_query": "",
-            "sql_result": {},
-            "final_answer": None,
-            "explanation": "",
-            "citations": [],
-            "errors": [],
-            "repair_count": 0
-        }
+    try:
+        final_state = app.invoke(initial_state)
         
-        try:
-            final_state = app.invoke(initial_state)
-            
-            output = {
-                "id": q["id"],
-                "final_answer": final_state.get("final_answer"),
-                "sql": final_state.get("sql_query", ""),
-                "confidence": 0.8 if not final_state.get("errors") else 0.4, # Simple heuristic
-                "explanation": final_state.get("explanation", ""),
-                "citations": final_state.get("citations", [])
-            }
-        except Exception as e:
-            print(f"Error processing {q['id']}: {e}")
-            output = {
-                "id": q["id"],
-                "final_answer": "Error processing request.",
-                "sql": "",
-                "confidence": 0.0,
-                "explanation": str(e),
-                "citations": []
-            }
-        results.append(output)
+        return {
+            "id": q["id"],
+            "final_answer": final_state.get("final_answer"),
+            "sql": final_state.get("sql_query", ""),
+            "confidence": 0.8 if not final_state.get("errors") else 0.4, # Simple heuristic
+            "explanation": final_state.get("explanation", ""),
+            "citations": final_state.get("citations", [])
+        }
+    except Exception as e:
+        print(f"Error processing {q['id']}: {e}")
+        return {
+            "id": q["id"],
+            "final_answer": "Error processing request.",
+            "sql": "",
+            "confidence": 0.0,
+            "explanation": str(e),
+            "citations": []
+        }
+
+def write_result(out, result: Dict):
+    out.write(json.dumps(result) + "\n")
+    out.flush() # Keep partial progress on disk if a long run dies
+
+def process_questions(input_file: str, output_file: str, max_workers: int = 8):
+    print(f"Streaming questions from {input_file} to {output_file}...")
+    app = build_graph()
+    router = get_router()
     
-    print(f"Writing results to {output_file}...")
-    with open(output_file, "w") as f:
-        for r in results:
-            f.write(json.dumps(r) + "\n")
+    # Questions are independent and LLM-latency bound, so run them concurrently.
+    # Futures are queued in input order and written as soon as the head of the queue finishes,
+    # which keeps the output aligned with the input while streaming results.
+    pending = deque()
+    with open(input_file, "r") as f, open(output_file, "w") as out, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for lines in iter(lambda: list(islice(f, ROUTER_BATCH_SIZE)), []):
+            questions = [json.loads(line) for line in lines if line.strip()]
+            strategies = route_batch(router, questions)
+            for q, strategy in zip(questions, strategies):
+                pending.append(executor.submit(process_question, app, q, strategy))
+            
+            while pending and pending[0].done():
+                write_result(out, pending.popleft().result())
+            # Bound the number of questions held in memory
+            while len(pending) > 2 * max_workers:
+                write_result(out, pending.popleft().result())
+        
+        while pending:
+            write_result(out, pending.popleft().result())
     print("Done.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--batch", required=True, help="Path to input jsonl file")
     parser.add_argument("--out", required=True, help="Path to output jsonl file")
+    parser.add_argument("--workers", type=int, default=8, help="Number of questions processed concurrently")
     args = parser.parse_args()
     
-    process_questions(args.batch, args.out)
+    process_questions(args.batch, args.out, max_workers=args.workers)